@@ -1,9 +1,14 @@
 import asyncio
-import json
+import functools
+from bisect import bisect_left, insort
 import logging
 import os
+import shutil
+import time
 
+import orjson
 from aiogram import Bot, Dispatcher, F, types
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
@@ -19,13 +24,20 @@ load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
 DATA_FILE = "staff_data.json"
+REVIEWS_FILE = "reviews.jsonl"
+REVIEWS_ARCHIVE_FILE = "reviews_archive.jsonl"
+RECENT_REVIEWS = 5
+REVIEWS_LOG_LIMIT = 512 * 1024
+REVIEWS_COMPACT_DELAY = 2
+REVIEW_COOLDOWN = timedelta(days=1).total_seconds()
 PHOTOS_DIR = "staff_photos"
+BOT_CONNECTIONS_LIMIT = 200
 
 os.makedirs(PHOTOS_DIR, exist_ok=True)
 
 logging.basicConfig(level=logging.INFO)
 
-bot = Bot(token=BOT_TOKEN)
+bot = Bot(token=BOT_TOKEN, session=AiohttpSession(limit=BOT_CONNECTIONS_LIMIT))
 dp = Dispatcher(storage=MemoryStorage())
 
 # CATEGORIES
@@ -50,74 +62,312 @@ class ReviewStates(StatesGroup):
 
 # DATA
 
+# служебные поля staff_data.json: номер последней записи лога, вошедшей в файл
+_meta = {"log_seq": 0}
+
+
+def migrate_review(review):
+    # старые отзывы без ts: вычисляем один раз из даты
+    if "ts" not in review and "date" in review:
+        review["ts"] = int(datetime.fromisoformat(review["date"]).timestamp())
+
+
+def init_review_stats(obj):
+    for r in obj["reviews"]:
+        migrate_review(r)
+
+    # сумма и количество оценок, чтобы не пересчитывать рейтинг по всем отзывам
+    obj.setdefault("rating_sum", sum(r["rating"] for r in obj["reviews"]))
+    obj.setdefault("rating_count", len(obj["reviews"]))
+
+    # время последнего отзыва каждого пользователя (unix time)
+    if "last_review_by_user" not in obj:
+        last = {}
+        for r in obj["reviews"]:
+            if "user_id" in r and "ts" in r:
+                key = str(r["user_id"])
+                last[key] = max(r["ts"], last.get(key, 0))
+        obj["last_review_by_user"] = last
+
+
 def load_staff_data():
     if not os.path.exists(DATA_FILE):
         data = {}
         for k in ALL_CATEGORIES:
             if k in KITCHEN_CATEGORIES:
                 data[k] = {"rating": 0, "reviews": []}
+                init_review_stats(data[k])
             else:
                 data[k] = {}
         return data
 
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    with open(DATA_FILE, "rb") as f:
+        raw = f.read()
+    data = orjson.loads(raw)
+    _meta.update(data.pop("_meta", {}))
 
     for k in ALL_CATEGORIES:
         if k in KITCHEN_CATEGORIES:
             data.setdefault(k, {})
             data[k].setdefault("rating", 0)
             data[k].setdefault("reviews", [])
+            init_review_stats(data[k])
         else:
             data.setdefault(k, {})
+            for staff in data[k].values():
+                staff.setdefault("reviews", [])
+                init_review_stats(staff)
 
     return data
 
 
 def save_staff_data():
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(staff_data, f, ensure_ascii=False, indent=2)
+    # пишем во временный файл и подменяем, чтобы при сбое не остался битый JSON
+    tmp = DATA_FILE + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(orjson.dumps({**staff_data, "_meta": _meta}, option=orjson.OPT_INDENT_2))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, DATA_FILE)
+
+
+# кэш топа сотрудников, сбрасывается при каждом новом отзыве
+_top_cache = {}
+_top_text = None
+
+
+def invalidate_top_cache():
+    global _top_text
+    _top_cache.clear()
+    _top_text = None
+
+
+# сотрудники, отсортированные по рейтингу:
+# (-rating, порядок, category, staff_id, название категории)
+_top_ranking = []
+_top_keys = {}
+
+
+def rebuild_top_ranking():
+    _top_ranking.clear()
+    _top_keys.clear()
+    for category, staff_list in staff_data.items():
+        # пропускаем кухонные цеха (они не сотрудники)
+        if category in KITCHEN_CATEGORIES:
+            continue
+        cat_display = ALL_CATEGORIES.get(category, category)
+        for staff_id, staff in staff_list.items():
+            key = (-staff.get("rating", 0), len(_top_keys), category, staff_id, cat_display)
+            _top_keys[(category, staff_id)] = key
+    _top_ranking.extend(sorted(_top_keys.values()))
+
+
+def update_top_ranking(category, staff_id, rating):
+    old = _top_keys[(category, staff_id)]
+    del _top_ranking[bisect_left(_top_ranking, old)]
+    new = (-rating, *old[1:])
+    _top_keys[(category, staff_id)] = new
+    insort(_top_ranking, new)
+
+
+def get_review_target(category, staff_id=None):
+    if staff_id is None:
+        return staff_data[category]
+    return staff_data[category][staff_id]
+
+
+def add_review(category, staff_id, review):
+    obj = get_review_target(category, staff_id)
+    obj["reviews"].append(review)
+    # в staff_data храним только последние отзывы, полная история — в архиве
+    del obj["reviews"][:-RECENT_REVIEWS]
+    obj["rating_sum"] += review["rating"]
+    obj["rating_count"] += 1
+    obj["rating"] = round(obj["rating_sum"] / obj["rating_count"], 1)
+    obj["last_review_by_user"][str(review["user_id"])] = review["ts"]
+    if staff_id is not None:
+        update_top_ranking(category, staff_id, obj["rating"])
+    invalidate_top_cache()
+
+
+def replay_review_log():
+    # отзывы, записанные после последнего сохранения staff_data.json
+    if not os.path.exists(REVIEWS_FILE):
+        return
+
+    with open(REVIEWS_FILE, "rb") as f:
+        raw = f.read()
+
+    saved_seq = _meta["log_seq"]
+    for line in raw.splitlines():
+        if not line.strip():
+            continue
+        try:
+            entry = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            # недописанная строка после аварийного завершения
+            logging.warning("Skipping malformed review log line: %r", line)
+            continue
+
+        # запись уже вошла в staff_data.json до сбоя при сжатии лога
+        seq = entry.get("seq")
+        if seq is not None:
+            if seq <= saved_seq:
+                continue
+            _meta["log_seq"] = seq
+
+        migrate_review(entry["review"])
+        try:
+            add_review(entry["category"], entry["staff_id"], entry["review"])
+        except KeyError:
+            logging.warning("Skipping review for unknown target: %s", entry)
+
+
+def review_line(category, staff_id, review, seq=None):
+    entry = {"category": category, "staff_id": staff_id, "review": review}
+    if seq is not None:
+        entry["seq"] = seq
+    return orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE)
+
+
+def log_review(category, staff_id, review):
+    _meta["log_seq"] += 1
+    _reviews_fp.write(review_line(category, staff_id, review, _meta["log_seq"]))
+
+
+def archive_legacy_reviews():
+    # один раз переносим в архив все отзывы, сохранённые до появления лога;
+    # новые отзывы попадают в архив вместе с логом при его сжатии
+    if _meta.get("reviews_archived"):
+        return False
+
+    lines = []
+    for category, staff_id, obj in iter_review_targets():
+        lines.extend(review_line(category, staff_id, r) for r in obj["reviews"])
+        del obj["reviews"][:-RECENT_REVIEWS]
+
+    if lines:
+        with open(REVIEWS_ARCHIVE_FILE, "ab") as f:
+            f.write(b"".join(lines))
+    _meta["reviews_archived"] = True
+    return True
+
+
+def iter_review_targets():
+    for category, items in staff_data.items():
+        if category in KITCHEN_CATEGORIES:
+            yield category, None, items
+        else:
+            for staff_id, obj in items.items():
+                yield category, staff_id, obj
+
+
+def prune_review_index():
+    # отметки старше REVIEW_COOLDOWN уже не нужны can_leave_review
+    cutoff = time.time() - REVIEW_COOLDOWN
+    for _, _, obj in iter_review_targets():
+        obj["last_review_by_user"] = {
+            user_id: ts
+            for user_id, ts in obj["last_review_by_user"].items()
+            if ts > cutoff
+        }
+
+
+def compact_review_log():
+    prune_review_index()
+    save_staff_data()
+    with open(REVIEWS_FILE, "rb") as src, open(REVIEWS_ARCHIVE_FILE, "ab") as dst:
+        shutil.copyfileobj(src, dst)
+    _reviews_fp.seek(0)
+    _reviews_fp.truncate()
+
+
+_compact_event = asyncio.Event()
+# не даёт дописать отзыв в лог, пока он сжимается в другом потоке
+_reviews_lock = asyncio.Lock()
+
+
+async def review_log_compactor():
+    # объединяем несколько запросов на сжатие лога в одну запись staff_data.json
+    while True:
+        await _compact_event.wait()
+        await asyncio.sleep(REVIEWS_COMPACT_DELAY)
+        _compact_event.clear()
+        try:
+            async with _reviews_lock:
+                await asyncio.to_thread(compact_review_log)
+        except Exception:
+            # лог остаётся на диске, следующий отзыв снова запустит сжатие
+            logging.exception("Review log compaction failed")
 
 
 staff_data = load_staff_data()
+if archive_legacy_reviews():
+    save_staff_data()
+rebuild_top_ranking()
+replay_review_log()
+
+_reviews_fp = open(REVIEWS_FILE, "ab", buffering=0)
+if _reviews_fp.tell() > REVIEWS_LOG_LIMIT:
+    compact_review_log()
 
 # HELPERS
 
 def get_top_staff(min_reviews=3, limit=10):
+    key = (min_reviews, limit)
+    if key in _top_cache:
+        return _top_cache[key]
+
     result = []
 
+    for _, _, category, staff_id, cat_display in _top_ranking:
+        if len(result) == limit:
+            break
+
+        staff = staff_data[category][staff_id]
+        reviews_count = staff["rating_count"]
+        if staff.get("rating", 0) > 0 and reviews_count >= min_reviews:
+            result.append({
+                "name": staff["name"],
+                "rating": staff["rating"],
+                "reviews": reviews_count,
+                "category": cat_display
+            })
+
+    _top_cache[key] = result
+    return result
+
+# проверенные пути к фото, чтобы не делать stat() на каждый просмотр
+_photo_paths = {}
+# file_id уже загруженных в Telegram фото, чтобы не отправлять файл повторно
+_photo_file_ids = {}
+
+
+def refresh_photo_path(category, staff_id):
+    # вызывать после смены фото сотрудника
+    photo = staff_data[category][staff_id].get("photo")
+    path = os.path.join(PHOTOS_DIR, photo) if photo else None
+    _photo_paths[(category, staff_id)] = path if path and os.path.exists(path) else None
+    _photo_file_ids.pop((category, staff_id), None)
+
+
+def cache_photo_paths():
     for category, staff_list in staff_data.items():
-        # пропускаем кухонные цеха (они не сотрудники)
         if category in KITCHEN_CATEGORIES:
             continue
+        for staff_id in staff_list:
+            refresh_photo_path(category, staff_id)
 
-        for staff_id, staff in staff_list.items():
-            if staff.get("rating", 0) > 0 and len(staff.get("reviews", [])) >= min_reviews:
-                result.append({
-                    "name": staff["name"],
-                    "rating": staff["rating"],
-                    "reviews": len(staff["reviews"]),
-                    "category": ALL_CATEGORIES.get(category, category)
-                })
-
-    result.sort(key=lambda x: x["rating"], reverse=True)
-    return result[:limit]
 
 def get_photo_path(category, staff_id):
-    photo = staff_data[category][staff_id].get("photo")
-    if not photo:
-        return None
-    path = os.path.join(PHOTOS_DIR, photo)
-    return path if os.path.exists(path) else None
+    return _photo_paths.get((category, staff_id))
+
+
+cache_photo_paths()
 
 def can_leave_review(obj, user_id):
-    now = datetime.now()
-    for r in obj["reviews"]:
-        if r.get("user_id") == user_id:
-            last_time = datetime.fromisoformat(r["date"])
-            if now - last_time < timedelta(days=1):
-                return False
-    return True
+    last_time = obj["last_review_by_user"].get(str(user_id))
+    return last_time is None or time.time() - last_time >= REVIEW_COOLDOWN
 
 async def smart_edit(cb: types.CallbackQuery, text: str, keyboard):
     if cb.message.photo:
@@ -166,6 +416,8 @@ def kitchen_keyboard():
     return kb.as_markup()
 
 
+# состав сотрудников меняется только при перезапуске, поэтому клавиатуры кэшируются
+@functools.cache
 def staff_list_keyboard(category):
     kb = InlineKeyboardBuilder()
     for staff_id, staff in staff_data[category].items():
@@ -175,6 +427,7 @@ def staff_list_keyboard(category):
     return kb.as_markup()
 
 
+@functools.cache
 def staff_actions_keyboard(category, staff_id):
     kb = InlineKeyboardBuilder()
     kb.button(text="⭐ Отзывы", callback_data=f"reviews_{category}_{staff_id}")
@@ -184,6 +437,7 @@ def staff_actions_keyboard(category, staff_id):
     return kb.as_markup()
 
 
+@functools.cache
 def workshop_keyboard(category):
     kb = InlineKeyboardBuilder()
     kb.button(text="⭐ Отзывы", callback_data=f"reviews_workshop_{category}")
@@ -192,6 +446,28 @@ def workshop_keyboard(category):
     kb.adjust(1)
     return kb.as_markup()
 
+
+def top_staff_keyboard():
+    kb = InlineKeyboardBuilder()
+    kb.button(text="↩️ Назад", callback_data="select_category")
+    return kb.as_markup()
+
+
+def rating_keyboard():
+    kb = InlineKeyboardBuilder()
+    for i in range(1, 6):
+        kb.button(text=f"{i} ⭐", callback_data=f"rate_{i}")
+    kb.adjust(5)
+    return kb.as_markup()
+
+
+START_KB = start_keyboard()
+MAIN_MENU_KB = main_menu()
+CATEGORY_KB = category_keyboard()
+KITCHEN_KB = kitchen_keyboard()
+RATING_KB = rating_keyboard()
+TOP_STAFF_KB = top_staff_keyboard()
+
 # HANDLERS
 
 @dp.callback_query(F.data == "main_menu")
@@ -199,7 +475,7 @@ async def back_to_main_menu(cb: types.CallbackQuery):
     await replace_message(
         cb,
         "📋 Главное меню\n\nВыберите действие:",
-        main_menu()
+        MAIN_MENU_KB
     )
     await cb.answer()
 
@@ -213,49 +489,51 @@ async def replace_message(cb: types.CallbackQuery, text: str, keyboard):
 
 @dp.message(Command("start"))
 async def start(message: types.Message):
-    await message.answer("🍇 Добро пожаловать в бот ресторана «Форос»! 🍷 \n\nСпасибо, что заглянули!\nЗдесь вы можете сделать две простые, но очень важные для нас вещи:\n\n1️⃣ Оставить отзыв о вашем посещении — поделитесь впечатлениями о кухне, обслуживании и атмосфере. Это поможет другим гостям и нам самим становиться лучше.\n\n2️⃣ Поддержать нашу команду чаевыми, если у вас остались тёплые эмоции после визита!", reply_markup=start_keyboard())
+    await message.answer("🍇 Добро пожаловать в бот ресторана «Форос»! 🍷 \n\nСпасибо, что заглянули!\nЗдесь вы можете сделать две простые, но очень важные для нас вещи:\n\n1️⃣ Оставить отзыв о вашем посещении — поделитесь впечатлениями о кухне, обслуживании и атмосфере. Это поможет другим гостям и нам самим становиться лучше.\n\n2️⃣ Поддержать нашу команду чаевыми, если у вас остались тёплые эмоции после визита!", reply_markup=START_KB)
 
 @dp.callback_query(F.data == "top_staff")
 async def show_top_staff(cb: types.CallbackQuery):
-    top = get_top_staff()
+    global _top_text
 
-    if not top:
-        text = "Пока нет сотрудников с достаточным количеством отзывов 😔"
-    else:
-        text = "<b>🏆 ТОП сотрудников</b>\n\n"
-        for i, s in enumerate(top, start=1):
-            text += (
+    if _top_text is None:
+        top = get_top_staff()
+
+        if not top:
+            text = "Пока нет сотрудников с достаточным количеством отзывов 😔"
+        else:
+            parts = ["<b>🏆 ТОП сотрудников</b>\n\n"]
+            parts.extend(
                 f"{i}. <b>{s['name']}</b>\n"
                 f"   {s['category']}\n"
                 f"   ⭐ {s['rating']} | 📝 {s['reviews']} отзывов\n\n"
+                for i, s in enumerate(top, start=1)
             )
+            text = "".join(parts)
 
-    kb = InlineKeyboardBuilder()
-    kb.button(text="↩️ Назад", callback_data="select_category")
+        _top_text = text
 
-    await smart_edit(cb, text, kb.as_markup())
+    await smart_edit(cb, _top_text, TOP_STAFF_KB)
     await cb.answer()
 
 
 @dp.message(F.text == "🚀 START")
 async def start_pressed(message: types.Message):
-    await message.answer("📋 Главное меню\n\nЗдесь вы можете поделиться своим мнением о визите в ресторан «Форос». Выберите действие:\n\n⭐ Топ сотрудников\n\nПосмотрите рейтинг наших коллег, отмеченных в отзывах гостей. Узнайте, кто создаёт самые тёплые впечатления!\n\n📝 Оставить отзыв или поддержать нашу команду\nВыберите категорию, чтобы ваша благодарность или совет попали точно адресату:", reply_markup=main_menu())
+    await message.answer("📋 Главное меню\n\nЗдесь вы можете поделиться своим мнением о визите в ресторан «Форос». Выберите действие:\n\n⭐ Топ сотрудников\n\nПосмотрите рейтинг наших коллег, отмеченных в отзывах гостей. Узнайте, кто создаёт самые тёплые впечатления!\n\n📝 Оставить отзыв или поддержать нашу команду\nВыберите категорию, чтобы ваша благодарность или совет попали точно адресату:", reply_markup=MAIN_MENU_KB)
 
 
 @dp.callback_query(F.data == "select_category")
 async def select_category(cb: types.CallbackQuery):
-    await replace_message(cb, "Выберите категорию чтобы оставить отзыв 🗨️ или оставить на чай ☕:", category_keyboard())
+    await replace_message(cb, "Выберите категорию чтобы оставить отзыв 🗨️ или оставить на чай ☕:", CATEGORY_KB)
     await cb.answer()
 
 
 @dp.callback_query(F.data == "select_kitchen")
 async def select_kitchen(cb: types.CallbackQuery):
-    await replace_message(cb, "Выберите цех кухни:", kitchen_keyboard())
+    await replace_message(cb, "Выберите цех кухни:", KITCHEN_KB)
     await cb.answer()
 
 
-@dp.callback_query(F.data.startswith("category_"))
-async def show_category(cb: types.CallbackQuery):
+async def show_category(cb: types.CallbackQuery, state: FSMContext):
     category = cb.data.replace("category_", "")
 
     if category in KITCHEN_CATEGORIES:
@@ -263,7 +541,7 @@ async def show_category(cb: types.CallbackQuery):
         text = (
             f"<b>{KITCHEN_CATEGORIES[category]}</b>\n"
             f"⭐ Рейтинг: {workshop['rating']}/5\n"
-            f"📝 Отзывов: {len(workshop['reviews'])}"
+            f"📝 Отзывов: {workshop['rating_count']}"
         )
         await smart_edit(cb, text, workshop_keyboard(category))
         await cb.answer()
@@ -273,11 +551,8 @@ async def show_category(cb: types.CallbackQuery):
     await cb.answer()
 
 
-@dp.callback_query(F.data.startswith("staff_"))
-async def show_staff(cb: types.CallbackQuery):
-    parts = cb.data.split("_")
-    staff_id = parts[-1]
-    category = "_".join(parts[1:-1])
+async def show_staff(cb: types.CallbackQuery, state: FSMContext):
+    category, _, staff_id = cb.data[len("staff_"):].rpartition("_")
 
     staff = staff_data[category][staff_id]
     photo = get_photo_path(category, staff_id)
@@ -291,12 +566,14 @@ async def show_staff(cb: types.CallbackQuery):
     await cb.message.delete()
 
     if photo:
-        await cb.message.answer_photo(
-            photo=types.FSInputFile(photo),
+        key = (category, staff_id)
+        sent = await cb.message.answer_photo(
+            photo=_photo_file_ids.get(key) or types.FSInputFile(photo),
             caption=text,
             parse_mode="HTML",
             reply_markup=staff_actions_keyboard(category, staff_id)
         )
+        _photo_file_ids[key] = sent.photo[-1].file_id
     else:
         await cb.message.answer(
             text,
@@ -308,36 +585,38 @@ async def show_staff(cb: types.CallbackQuery):
 
 # REVIEWS VIEW
 
-@dp.callback_query(F.data.startswith("reviews_workshop_"))
-async def show_workshop_reviews(cb: types.CallbackQuery):
+async def show_workshop_reviews(cb: types.CallbackQuery, state: FSMContext):
     category = cb.data.replace("reviews_workshop_", "")
     workshop = staff_data[category]
 
     if not workshop["reviews"]:
         text = "Пока нет отзывов."
     else:
-        text = "<b>Отзывы о цехе:</b>\n\n"
-        for r in workshop["reviews"][-5:]:
-            text += f"⭐ {r['rating']} — {r['user']}\n{r['text']}\n\n"
+        parts = ["<b>Отзывы о цехе:</b>\n\n"]
+        parts.extend(
+            f"⭐ {r['rating']} — {r['user']}\n{r['text']}\n\n"
+            for r in workshop["reviews"][-5:]
+        )
+        text = "".join(parts)
 
     await smart_edit(cb, text, workshop_keyboard(category))
     await cb.answer()
 
 
-@dp.callback_query(F.data.startswith("reviews_"))
-async def show_staff_reviews(cb: types.CallbackQuery):
-    parts = cb.data.split("_")
-    staff_id = parts[-1]
-    category = "_".join(parts[1:-1])
+async def show_staff_reviews(cb: types.CallbackQuery, state: FSMContext):
+    category, _, staff_id = cb.data[len("reviews_"):].rpartition("_")
 
     staff = staff_data[category][staff_id]
 
     if not staff["reviews"]:
         text = "Пока нет отзывов."
     else:
-        text = "<b>Отзывы:</b>\n\n"
-        for r in staff["reviews"][-5:]:
-            text += f"⭐ {r['rating']} — {r['user']}\n{r['text']}\n\n"
+        parts = ["<b>Отзывы:</b>\n\n"]
+        parts.extend(
+            f"⭐ {r['rating']} — {r['user']}\n{r['text']}\n\n"
+            for r in staff["reviews"][-5:]
+        )
+        text = "".join(parts)
 
     kb = InlineKeyboardBuilder()
     kb.button(text="↩️ Назад", callback_data=f"staff_{category}_{staff_id}")
@@ -347,7 +626,6 @@ async def show_staff_reviews(cb: types.CallbackQuery):
 
 # REVIEWS ADD
 
-@dp.callback_query(F.data.startswith("review_workshop_"))
 async def review_workshop_start(cb: types.CallbackQuery, state: FSMContext):
     category = cb.data.replace("review_workshop_", "")
     obj = staff_data[category]
@@ -362,19 +640,11 @@ async def review_workshop_start(cb: types.CallbackQuery, state: FSMContext):
     await state.update_data(category=category, workshop=True)
     await state.set_state(ReviewStates.rating)
 
-    kb = InlineKeyboardBuilder()
-    for i in range(1, 6):
-        kb.button(text=f"{i} ⭐", callback_data=f"rate_{i}")
-    kb.adjust(5)
-
-    await smart_edit(cb, "Оцените цех:", kb.as_markup())
+    await smart_edit(cb, "Оцените цех:", RATING_KB)
     await cb.answer()
 
-@dp.callback_query(F.data.startswith("review_"))
 async def review_staff_start(cb: types.CallbackQuery, state: FSMContext):
-    parts = cb.data.split("_")
-    staff_id = parts[-1]
-    category = "_".join(parts[1:-1])
+    category, _, staff_id = cb.data[len("review_"):].rpartition("_")
     obj = staff_data[category][staff_id]
 
     if not can_leave_review(obj, cb.from_user.id):
@@ -387,17 +657,14 @@ async def review_staff_start(cb: types.CallbackQuery, state: FSMContext):
     await state.update_data(category=category, staff_id=staff_id)
     await state.set_state(ReviewStates.rating)
 
-    kb = InlineKeyboardBuilder()
-    for i in range(1, 6):
-        kb.button(text=f"{i} ⭐", callback_data=f"rate_{i}")
-    kb.adjust(5)
-
-    await smart_edit(cb, "Выберите оценку:", kb.as_markup())
+    await smart_edit(cb, "Выберите оценку:", RATING_KB)
     await cb.answer()
 
 
-@dp.callback_query(ReviewStates.rating, F.data.startswith("rate_"))
 async def review_rating(cb: types.CallbackQuery, state: FSMContext):
+    if await state.get_state() != ReviewStates.rating.state:
+        return
+
     rating = int(cb.data.replace("rate_", ""))
     await state.update_data(rating=rating)
     await state.set_state(ReviewStates.text)
@@ -405,34 +672,68 @@ async def review_rating(cb: types.CallbackQuery, state: FSMContext):
     await cb.answer()
 
 
+# CALLBACK ROUTING
+
+async def route_reviews(cb: types.CallbackQuery, state: FSMContext):
+    if cb.data.startswith("reviews_workshop_"):
+        await show_workshop_reviews(cb, state)
+    else:
+        await show_staff_reviews(cb, state)
+
+
+async def route_review(cb: types.CallbackQuery, state: FSMContext):
+    if cb.data.startswith("review_workshop_"):
+        await review_workshop_start(cb, state)
+    else:
+        await review_staff_start(cb, state)
+
+
+# первый токен callback_data -> обработчик
+CALLBACK_ROUTES = {
+    "category": show_category,
+    "staff": show_staff,
+    "reviews": route_reviews,
+    "review": route_review,
+    "rate": review_rating,
+}
+
+
+@dp.callback_query()
+async def dispatch_callback(cb: types.CallbackQuery, state: FSMContext):
+    handler = CALLBACK_ROUTES.get(cb.data.partition("_")[0])
+    if handler is not None:
+        await handler(cb, state)
+
+
 @dp.message(ReviewStates.text)
 async def review_text(message: types.Message, state: FSMContext):
     data = await state.get_data()
+    category = data["category"]
+    staff_id = None if data.get("workshop") else data["staff_id"]
+
+    now = time.time()
+    review = {
+        "user_id": message.from_user.id,
+        "user": message.from_user.full_name,
+        "rating": data["rating"],
+        "text": message.text,
+        "date": datetime.fromtimestamp(now).isoformat(),
+        "ts": int(now)
+    }
+
+    async with _reviews_lock:
+        add_review(category, staff_id, review)
+        log_review(category, staff_id, review)
+
+    if _reviews_fp.tell() > REVIEWS_LOG_LIMIT:
+        _compact_event.set()
 
-    if data.get("workshop"):
-        obj = staff_data[data["category"]]
-    else:
-        obj = staff_data[data["category"]][data["staff_id"]]
-
-    obj["reviews"].append({
-    "user_id": message.from_user.id,
-    "user": message.from_user.full_name,
-    "rating": data["rating"],
-    "text": message.text,
-    "date": datetime.now().isoformat()
-    })
-
-    obj["rating"] = round(
-        sum(r["rating"] for r in obj["reviews"]) / len(obj["reviews"]), 1
-    )
-
-    save_staff_data()
     await state.clear()
 
     # возвращаем кнопку START
     await message.answer(
         "✅ Отзыв сохранён!\n\nНажмите 🚀 START, чтобы оставить отзыв или оставить на чай!",
-        reply_markup=start_keyboard()
+        reply_markup=START_KB
     )
 
 
@@ -440,22 +741,25 @@ async def review_text(message: types.Message, state: FSMContext):
 
 
 @dp.message()
-async def fallback(message: types.Message):
+async def fallback(message: types.Message, state: FSMContext):
     # Если пользователь не находится в FSM (не пишет отзыв)
-    state = dp.fsm.get_context(bot, message.chat.id, message.from_user.id)
     current_state = await state.get_state()
 
     if current_state is None:
         await message.answer(
             "Нажмите 🚀 START для начала работы",
-            reply_markup=start_keyboard()
+            reply_markup=START_KB
         )
 
 # RUN
 
 async def main():
+    compactor = asyncio.create_task(review_log_compactor())
     await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        compactor.cancel()
 
 if __name__ == "__main__":
     asyncio.run(main())